@@ -43,6 +43,10 @@ class KeyCode(object):
     #: The names of attributes used as platform extensions.
     _PLATFORM_EXTENSIONS = []
 
+    # Key codes are created for every key event, so avoid a dict per instance;
+    # platform implementations add their extensions as slots
+    __slots__ = ('vk', 'char', 'is_dead', 'combining')
+
     def __init__(self, vk=None, char=None, is_dead=False, **kwargs):
         self.vk = vk
         self.char = six.text_type(char) if char is not None else None
@@ -66,6 +70,22 @@ class KeyCode(object):
             raise ValueError(kwargs)
 
 
+    def __getstate__(self):
+        # Classes with slots must provide their state to support pickle
+        # protocols 0 and 1; subclasses without slots keep their state in the
+        # instance dict
+        state = dict(getattr(self, '__dict__', {}))
+        state.update(
+            (name, getattr(self, name))
+            for cls in type(self).__mro__
+            for name in getattr(cls, '__slots__', ())
+            if hasattr(self, name))
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __repr__(self):
         if self.is_dead:
             return '[%s]' % repr(self.char)
@@ -574,7 +594,7 @@ class Controller(object):
         :return: a key code, or ``None`` if it cannot be resolved
         """
         # Use the value for the key constants
-        if key in (k for k in self._Key):
+        if isinstance(key, self._Key):
             return key.value
 
         # Convert strings to key codes
@@ -27,6 +27,7 @@ The keyboard implementation for *macOS*.
 import enum
 
 import Quartz
+import six
 
 from pynput._util.darwin import (
     get_unicode_to_keycode_map,
@@ -65,10 +66,40 @@ NX_KEYTYPE_ILLUMINATION_UP = 21
 NX_KEYTYPE_ILLUMINATION_DOWN = 22
 NX_KEYTYPE_ILLUMINATION_TOGGLE = 23
 
+# From hidsystem/IOLLEvent.h
+NX_DEVICELCTLKEYMASK = 0x00000001
+NX_DEVICELSHIFTKEYMASK = 0x00000002
+NX_DEVICERSHIFTKEYMASK = 0x00000004
+NX_DEVICELCMDKEYMASK = 0x00000008
+NX_DEVICERCMDKEYMASK = 0x00000010
+NX_DEVICELALTKEYMASK = 0x00000020
+NX_DEVICERALTKEYMASK = 0x00000040
+NX_DEVICERCTLKEYMASK = 0x00002000
+
+#: All device dependent modifier flags
+NX_DEVICE_MODIFIER_MASKS = (
+    NX_DEVICELCTLKEYMASK |
+    NX_DEVICELSHIFTKEYMASK |
+    NX_DEVICERSHIFTKEYMASK |
+    NX_DEVICELCMDKEYMASK |
+    NX_DEVICERCMDKEYMASK |
+    NX_DEVICELALTKEYMASK |
+    NX_DEVICERALTKEYMASK |
+    NX_DEVICERCTLKEYMASK)
+
 # pylint: disable=C0103; We want to use the names from the C API
 # This is undocumented, but still widely known
 kSystemDefinedEventMediaKeysSubtype = 8
 
+#: The key states of media key events, as a mapping from whether the key is
+#: pressed to the value stored in the modifier flags and event data
+MEDIA_KEY_STATES = {
+    True: 0xa,
+    False: 0xb}
+
+#: The key state of pressed media keys, as stored in the event data
+_MEDIA_KEY_PRESSED = MEDIA_KEY_STATES[True] << 8
+
 # We extract this here since the name is very long
 otherEventWithType = getattr(
         Quartz.NSEvent,
@@ -81,8 +112,33 @@ otherEventWithType = getattr(
         'subtype_'
         'data1_'
         'data2_')
+
+# These are used for every event sent by the controller or received by the
+# listener, so we bind them here to avoid repeated module attribute lookups;
+# values only used when this module is loaded are read from Quartz directly
+kCGEventKeyDown = Quartz.kCGEventKeyDown
+kCGEventKeyUp = Quartz.kCGEventKeyUp
+kCGEventFlagMaskControl = Quartz.kCGEventFlagMaskControl
+kCGHIDEventTap = Quartz.kCGHIDEventTap
+kCGKeyboardEventKeycode = Quartz.kCGKeyboardEventKeycode
+NSSystemDefined = Quartz.NSSystemDefined
+CGEventCreateCopy = Quartz.CGEventCreateCopy
+CGEventCreateKeyboardEvent = Quartz.CGEventCreateKeyboardEvent
+CGEventGetFlags = Quartz.CGEventGetFlags
+CGEventGetIntegerValueField = Quartz.CGEventGetIntegerValueField
+CGEventGetType = Quartz.CGEventGetType
+CGEventKeyboardGetUnicodeString = Quartz.CGEventKeyboardGetUnicodeString
+CGEventKeyboardSetUnicodeString = Quartz.CGEventKeyboardSetUnicodeString
+CGEventPost = Quartz.CGEventPost
+CGEventSetFlags = Quartz.CGEventSetFlags
+eventWithCGEvent = Quartz.NSEvent.eventWithCGEvent_
 # pylint: enable=C0103
 
+#: Determines whether a string is printable; Python 2 strings lack
+#: ``isprintable``, so we fall back on ``isalnum``
+_is_printable = getattr(
+    six.text_type, 'isprintable', None) or six.text_type.isalnum
+
 
 class KeyCode(_base.KeyCode):
     _PLATFORM_EXTENSIONS = (
@@ -91,7 +147,12 @@ class KeyCode(_base.KeyCode):
     )
 
     # Be explicit about fields
-    _is_media = None
+    __slots__ = _PLATFORM_EXTENSIONS
+
+    #: Prototype media key events, keyed by ``(vk, is_pressed)``; these are
+    #: copied for every media key event sent. Keyboard events are not cached,
+    #: since they are stamped with the time of their creation
+    _EVENT_CACHE = {}
 
     @classmethod
     def _from_media(cls, vk, **kwargs):
@@ -103,10 +164,11 @@ class KeyCode(_base.KeyCode):
         """
         return cls.from_vk(vk, _is_media=True, **kwargs)
 
-    def _event(self, modifiers, mapping, is_pressed):
+    def _event(self, modifier_flags, mapping, is_pressed):
         """This key as a *Quartz* event.
 
-        :param set modifiers: The currently active modifiers.
+        :param int modifier_flags: The event flag mask of the currently active
+            modifiers.
 
         :param mapping: The current keyboard mapping.
 
@@ -116,41 +178,50 @@ class KeyCode(_base.KeyCode):
         """
         vk = self.vk or mapping.get(self.char)
         if self._is_media:
-            result = otherEventWithType(
-                Quartz.NSSystemDefined,
-                (0, 0),
-                0xa00 if is_pressed else 0xb00,
-                0,
-                0,
-                0,
-                8,
-                (self.vk << 16) | ((0xa if is_pressed else 0xb) << 8),
-                -1).CGEvent()
+            cache_key = (self.vk, is_pressed)
+            template = self._EVENT_CACHE.get(cache_key)
+            if template is None:
+                template = self._EVENT_CACHE.setdefault(
+                    cache_key, self._template(self.vk, is_pressed))
+            result = CGEventCreateCopy(template)
         else:
-            result = Quartz.CGEventCreateKeyboardEvent(
-                None, 0 if vk is None else vk, is_pressed)
+            result = self._template(vk, is_pressed)
 
-        Quartz.CGEventSetFlags(
-            result,
-            0
-            | (Quartz.kCGEventFlagMaskAlternate
-               if Key.alt in modifiers else 0)
-
-            | (Quartz.kCGEventFlagMaskCommand
-               if Key.cmd in modifiers else 0)
-
-            | (Quartz.kCGEventFlagMaskControl
-               if Key.ctrl in modifiers else 0)
-
-            | (Quartz.kCGEventFlagMaskShift
-               if Key.shift in modifiers else 0))
+        CGEventSetFlags(result, modifier_flags)
 
         if vk is None and self.char is not None:
-            Quartz.CGEventKeyboardSetUnicodeString(
+            CGEventKeyboardSetUnicodeString(
                 result, len(self.char), self.char)
 
         return result
 
+    def _template(self, vk, is_pressed):
+        """Creates a *Quartz* event for this key, without any modifier flags
+        set.
+
+        :param vk: The key code; for media keys this is the media key code,
+            otherwise the key code resolved from the keyboard mapping.
+
+        :param bool is_pressed: Whether to generate a press event.
+
+        :return: a *Quartz* event
+        """
+        if self._is_media:
+            state = MEDIA_KEY_STATES[is_pressed] << 8
+            return otherEventWithType(
+                NSSystemDefined,
+                (0, 0),
+                state,
+                0,
+                0,
+                0,
+                kSystemDefinedEventMediaKeysSubtype,
+                (vk << 16) | state,
+                -1).CGEvent()
+        else:
+            return CGEventCreateKeyboardEvent(
+                None, 0 if vk is None else vk, is_pressed)
+
 
 # pylint: disable=W0212
 class Key(enum.Enum):
@@ -261,6 +332,45 @@ class Key(enum.Enum):
 # pylint: enable=W0212
 
 
+#: The event flags set for the modifiers of the controller
+_CONTROLLER_MODIFIER_FLAGS = {
+    Key.alt: Quartz.kCGEventFlagMaskAlternate,
+    Key.cmd: Quartz.kCGEventFlagMaskCommand,
+    Key.ctrl: Quartz.kCGEventFlagMaskControl,
+    Key.shift: Quartz.kCGEventFlagMaskShift}
+
+
+def _special_keys(is_media):
+    """Creates a list mapping key codes to special keys.
+
+    :param is_media: The value of ``_is_media`` for the keys to include.
+
+    :return: a list indexed by key code, where unknown key codes map to
+        ``None``
+    """
+    result = [None] * 256
+    for key in Key:
+        # pylint: disable=W0212
+        if key.value._is_media == is_media:
+            result[key.value.vk] = key
+        # pylint: enable=W0212
+    return result
+
+
+def _modifier_masks(modifier_flags):
+    """Creates a list mapping key codes to modifier flag masks.
+
+    :param dict modifier_flags: A mapping from modifier key to flag mask.
+
+    :return: a list indexed by key code, where key codes for keys that are not
+        modifiers map to ``0``
+    """
+    result = [0] * 256
+    for key, mask in modifier_flags.items():
+        result[key.value.vk] = mask
+    return result
+
+
 class Controller(_base.Controller):
     _KeyCode = KeyCode
     _Key = Key
@@ -268,13 +378,27 @@ class Controller(_base.Controller):
     def __init__(self):
         super(Controller, self).__init__()
         self._mapping = get_unicode_to_keycode_map()
+        self._modifier_flags = 0
 
     def _handle(self, key, is_press):
-        with self.modifiers as modifiers:
-            Quartz.CGEventPost(
-                Quartz.kCGHIDEventTap,
-                (key if key not in (k for k in Key) else key.value)._event(
-                    modifiers, self._mapping, is_press))
+        with self._modifiers_lock:
+            CGEventPost(
+                kCGHIDEventTap,
+                key._event(
+                    self._modifier_flags, self._mapping, is_press))
+
+    def _update_modifiers(self, key, is_press):
+        # Keep the event flag mask in sync with the modifiers, so that it need
+        # not be calculated for every event; the lock is held throughout to
+        # never expose a mask not matching the modifiers
+        with self._modifiers_lock:
+            super(Controller, self)._update_modifiers(key, is_press)
+            if self._as_modifier(key):
+                flags = 0
+                for modifier in self._modifiers:
+                    flags |= _CONTROLLER_MODIFIER_FLAGS.get(
+                        self._as_modifier(modifier), 0)
+                self._modifier_flags = flags
 
 
 class Listener(ListenerMixin, _base.Listener):
@@ -286,12 +410,11 @@ class Listener(ListenerMixin, _base.Listener):
         Quartz.CGEventMaskBit(Quartz.NSSystemDefined)
     )
 
-    # pylint: disable=W0212
-    #: A mapping from keysym to special key
-    _SPECIAL_KEYS = {
-        (key.value.vk, key.value._is_media): key
-        for key in Key}
-    # pylint: enable=W0212
+    #: A list mapping key codes to special keys
+    _SPECIAL_REGULAR = _special_keys(None)
+
+    #: A list mapping media key codes to special keys
+    _SPECIAL_MEDIA = _special_keys(True)
 
     #: The event flags set for the various modifier keys
     _MODIFIER_FLAGS = {
@@ -308,6 +431,25 @@ class Listener(ListenerMixin, _base.Listener):
         Key.shift_l: Quartz.kCGEventFlagMaskShift,
         Key.shift_r: Quartz.kCGEventFlagMaskShift}
 
+    #: The device dependent event flags set for the various modifier keys;
+    #: these are only set for events from physical keyboards
+    _DEVICE_MODIFIER_FLAGS = {
+        Key.alt_l: NX_DEVICELALTKEYMASK,
+        Key.alt_r: NX_DEVICERALTKEYMASK,
+        Key.cmd_l: NX_DEVICELCMDKEYMASK,
+        Key.cmd_r: NX_DEVICERCMDKEYMASK,
+        Key.ctrl_l: NX_DEVICELCTLKEYMASK,
+        Key.ctrl_r: NX_DEVICERCTLKEYMASK,
+        Key.shift_l: NX_DEVICELSHIFTKEYMASK,
+        Key.shift_r: NX_DEVICERSHIFTKEYMASK}
+
+    #: A list mapping key codes to the event flags set for modifier keys
+    _MODIFIER_MASKS = _modifier_masks(_MODIFIER_FLAGS)
+
+    #: A list mapping key codes to the device dependent event flags set for
+    #: modifier keys
+    _DEVICE_MODIFIER_MASKS = _modifier_masks(_DEVICE_MODIFIER_FLAGS)
+
     def __init__(self, *args, **kwargs):
         super(Listener, self).__init__(*args, **kwargs)
         self._flags = 0
@@ -315,6 +457,10 @@ class Listener(ListenerMixin, _base.Listener):
         self._intercept = self._options.get(
             'intercept',
             None)
+        self._handlers = {
+            kCGEventKeyDown: self._handle_press,
+            kCGEventKeyUp: self._handle_release,
+            NSSystemDefined: self._handle_system}
 
     def _run(self):
         with keycode_context() as context:
@@ -325,87 +471,119 @@ class Listener(ListenerMixin, _base.Listener):
                 self._context = None
 
     def _handle(self, _proxy, event_type, event, _refcon):
+        # Read the current flag mask only once; it is used both to determine
+        # modifier state and to detect modifier state changes
+        flags_now = CGEventGetFlags(event)
+        vk = CGEventGetIntegerValueField(event, kCGKeyboardEventKeycode)
+
         # Convert the event to a KeyCode; this may fail, and in that case we
         # pass None
         try:
-            key = self._event_to_key(event)
+            key = self._event_to_key(event, vk, flags_now)
         except IndexError:
             key = None
 
         try:
-            if event_type == Quartz.kCGEventKeyDown:
-                # This is a normal key press
-                self.on_press(key)
-
-            elif event_type == Quartz.kCGEventKeyUp:
-                # This is a normal key release
-                self.on_release(key)
-
-            elif key == Key.caps_lock:
-                # We only get an event when caps lock is toggled, so we fake
-                # press and release
-                self.on_press(key)
-                self.on_release(key)
-
-            elif event_type == Quartz.NSSystemDefined:
-                sys_event = Quartz.NSEvent.eventWithCGEvent_(event)
-                if sys_event.subtype() == kSystemDefinedEventMediaKeysSubtype:
-                    # The key in the special key dict; True since it is a media
-                    # key
-                    key = ((sys_event.data1() & 0xffff0000) >> 16, True)
-                    if key in self._SPECIAL_KEYS:
-                        flags = sys_event.data1() & 0x0000ffff
-                        is_press = ((flags & 0xff00) >> 8) == 0x0a
-                        if is_press:
-                            self.on_press(self._SPECIAL_KEYS[key])
-                        else:
-                            self.on_release(self._SPECIAL_KEYS[key])
-
-            else:
-                # This is a modifier event---excluding caps lock---for which we
-                # must check the current modifier state to determine whether
-                # the key was pressed or released
-                flags = Quartz.CGEventGetFlags(event)
-                is_press = flags & self._MODIFIER_FLAGS.get(key, 0)
+            self._handlers.get(event_type, self._handle_modifier)(
+                event, vk, key, flags_now)
+
+        finally:
+            # Store the current flag mask to be able to detect modifier state
+            # changes
+            self._flags = flags_now
+
+    def _handle_press(self, _event, _vk, key, _flags):
+        """Handles a normal key press.
+        """
+        self.on_press(key)
+
+    def _handle_release(self, _event, _vk, key, _flags):
+        """Handles a normal key release.
+        """
+        self.on_release(key)
+
+    def _handle_system(self, event, _vk, _key, _flags):
+        """Handles a system defined event, which may be a media key event.
+        """
+        sys_event = eventWithCGEvent(event)
+        if sys_event.subtype() == kSystemDefinedEventMediaKeysSubtype:
+            # The key in the list of media keys
+            data1 = sys_event.data1()
+            media_vk = (data1 & 0xffff0000) >> 16
+            key = self._SPECIAL_MEDIA[media_vk] \
+                if media_vk < len(self._SPECIAL_MEDIA) else None
+            if key is not None:
+                is_press = (data1 & 0xff00) == _MEDIA_KEY_PRESSED
                 if is_press:
                     self.on_press(key)
                 else:
                     self.on_release(key)
 
-        finally:
-            # Store the current flag mask to be able to detect modifier state
-            # changes
-            self._flags = Quartz.CGEventGetFlags(event)
+    def _handle_modifier(self, _event, vk, key, flags):
+        """Handles a modifier event.
+        """
+        if key == Key.caps_lock:
+            # We only get an event when caps lock is toggled, so we fake
+            # press and release
+            self.on_press(key)
+            self.on_release(key)
+            return
+
+        # For other modifiers we must check the modifier state change to
+        # determine whether the key was pressed or released
+        changed = flags ^ self._flags
+        if 0 <= vk < 256:
+            mask = self._MODIFIER_MASKS[vk]
+            device_mask = self._DEVICE_MODIFIER_MASKS[vk]
+        else:
+            mask, device_mask = 0, 0
+
+        # If this event carries device dependent flags, the flag for this key
+        # tells us exactly whether it toggled, even if the other key for the
+        # same modifier is held, and if it is set but did not toggle, this
+        # event carries no state change; events without device dependent
+        # flags, such as synthetic events, must be decided by the generic flag
+        if not flags & NX_DEVICE_MODIFIER_MASKS:
+            is_press = flags & mask
+        elif changed & device_mask:
+            is_press = flags & device_mask
+        elif flags & device_mask:
+            return
+        else:
+            is_press = flags & mask
+        if is_press:
+            self.on_press(key)
+        else:
+            self.on_release(key)
 
-    def _event_to_key(self, event):
+    def _event_to_key(self, event, vk, flags):
         """Converts a *Quartz* event to a :class:`KeyCode`.
 
         :param event: The event to convert.
 
+        :param int vk: The key code of the event.
+
+        :param int flags: The flag mask of the event.
+
         :return: a :class:`pynput.keyboard.KeyCode`
 
         :raises IndexError: if the key code is invalid
         """
-        vk = Quartz.CGEventGetIntegerValueField(
-            event, Quartz.kCGKeyboardEventKeycode)
-        event_type = Quartz.CGEventGetType(event)
-        is_media = True if event_type == Quartz.NSSystemDefined else None
+        event_type = CGEventGetType(event)
+        is_media = True if event_type == NSSystemDefined else None
 
         # First try special keys...
-        key = (vk, is_media)
-        if key in self._SPECIAL_KEYS:
-            return self._SPECIAL_KEYS[key]
+        special_keys = self._SPECIAL_MEDIA if is_media \
+            else self._SPECIAL_REGULAR
+        key = special_keys[vk] if 0 <= vk < len(special_keys) else None
+        if key is not None:
+            return key
 
         # ...then try characters...
-        length, chars = Quartz.CGEventKeyboardGetUnicodeString(
+        length, chars = CGEventKeyboardGetUnicodeString(
             event, 100, None, None)
-        try:
-            printable = chars.isprintable()
-        except AttributeError:
-            printable = chars.isalnum()
-        if not printable and vk in SYMBOLS \
-                and Quartz.CGEventGetFlags(event) \
-                & Quartz.kCGEventFlagMaskControl:
+        if not _is_printable(chars) and vk in SYMBOLS \
+                and flags & kCGEventFlagMaskControl:
             return KeyCode.from_char(SYMBOLS[vk], vk=vk)
         elif length > 0:
             return KeyCode.from_char(chars, vk=vk)
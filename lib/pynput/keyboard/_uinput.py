@@ -48,8 +48,7 @@ class KeyCode(_base.KeyCode):
     )
 
     # Be explicit about fields
-    _x_name = None
-    _kernel_name = None
+    __slots__ = _PLATFORM_EXTENSIONS
 # pylint: enable=W0212
 
     @classmethod
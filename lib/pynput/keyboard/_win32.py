@@ -57,8 +57,7 @@ class KeyCode(_base.KeyCode):
     )
 
     # Be explicit about fields
-    _flags = None
-    _scan = None
+    __slots__ = _PLATFORM_EXTENSIONS
 
     def _parameters(self, is_press):
         """The parameters to pass to ``SendInput`` to generate this key.
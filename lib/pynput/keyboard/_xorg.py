@@ -70,7 +70,7 @@ class KeyCode(_base.KeyCode):
     )
 
     # Be explicit about fields
-    _symbol = None
+    __slots__ = _PLATFORM_EXTENSIONS
 
     @classmethod
     def _from_symbol(cls, symbol, **kwargs):
@@ -0,0 +1,69 @@
+# coding=utf-8
+# pystray
+# Copyright (C) 2015-2022 Moses Palmér
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import pickle
+import unittest
+
+from pynput.keyboard import _base
+
+
+class SlottedKeyCode(_base.KeyCode):
+    _PLATFORM_EXTENSIONS = (
+        '_extension',
+    )
+
+    __slots__ = _PLATFORM_EXTENSIONS
+
+
+class UnslottedKeyCode(_base.KeyCode):
+    pass
+
+
+class KeyboardKeyCodeTest(unittest.TestCase):
+    def assert_copies(self, key, *names):
+        """Asserts that pickling and copying a key code retains the named
+        attributes.
+
+        :param key: The key code to copy.
+
+        :param names: The names of the attributes to check.
+        """
+        copies = [
+            pickle.loads(pickle.dumps(key, protocol))
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1)]
+        copies.append(copy.copy(key))
+        copies.append(copy.deepcopy(key))
+        for c in copies:
+            self.assertIs(type(c), type(key))
+            for name in names:
+                self.assertEqual(getattr(c, name), getattr(key, name))
+
+    def test_copy_slotted(self):
+        self.assert_copies(
+            SlottedKeyCode.from_vk(42, _extension=True),
+            'vk', 'char', 'is_dead', 'combining', '_extension')
+
+    def test_copy_dead(self):
+        self.assert_copies(
+            _base.KeyCode.from_dead('~'),
+            'vk', 'char', 'is_dead', 'combining')
+
+    def test_copy_unslotted(self):
+        key = UnslottedKeyCode.from_char('a')
+        key.foo = 1
+        self.assert_copies(key, 'vk', 'char', 'is_dead', 'combining', 'foo')